@@ -1,23 +1,69 @@
-from flask import Flask, render_template, request, send_file, send_from_directory, abort, jsonify
+from flask import Flask, Response, g, render_template, request, send_from_directory, abort, jsonify
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import os
 import calendar
+import ctypes
+import mimetypes
 import uuid
 import shutil
-import json
+import threading
+import time
+import orjson
+import xlsxwriter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
 from reportlab.platypus import SimpleDocTemplate, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 
 app = Flask(__name__)
+# Behind Apache/lighttpd, let the server stream downloads (X-Sendfile)
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "").lower() in {"1", "true", "yes"}
+# Behind Nginx, the internal location that maps to the output folder, e.g. /internal_output/
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX", "").strip()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
-CHART_HISTORY_FILE = os.path.join(BASE_DIR, "chart_history.json")
+CHART_HISTORY_FILE = os.path.join(BASE_DIR, "chart_history.jsonl")
+LEGACY_CHART_HISTORY_FILE = os.path.join(BASE_DIR, "chart_history.json")
+CHART_HISTORY_LIMIT = 20
+CHART_HISTORY_COMPACT_LINES = 200
+# Clients may reuse cached history/report responses but must revalidate via ETag
+REVALIDATE_CACHE_CONTROL = "max-age=0, must-revalidate"
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 OUTPUT_FOLDER = os.path.join(BASE_DIR, "output")
 
 
+def read_json_file(path):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def write_json_file(path, data):
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+def json_response(payload, status=200):
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+
+def history_not_modified(etag):
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_history_etag(Response(status=304), etag)
+
+
+def with_history_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return response
+
+
 def normalize_storage_path(path_value, fallback_name):
     if not path_value:
         return os.path.join(BASE_DIR, fallback_name)
@@ -40,8 +86,7 @@ def load_storage_config():
         }
 
     try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as config_file:
-            data = json.load(config_file)
+        data = read_json_file(CONFIG_FILE)
     except Exception:
         data = {}
 
@@ -56,8 +101,7 @@ def save_storage_config(upload_folder, output_folder):
         "upload_folder": upload_folder,
         "output_folder": output_folder,
     }
-    with open(CONFIG_FILE, "w", encoding="utf-8") as config_file:
-        json.dump(config_data, config_file, indent=2)
+    write_json_file(CONFIG_FILE, config_data)
 
 
 def apply_storage_paths(upload_folder, output_folder):
@@ -70,17 +114,18 @@ def apply_storage_paths(upload_folder, output_folder):
 
 def get_directory_roots():
     if os.name == "nt":
-        roots = []
-        for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
-            drive = f"{letter}:\\"
-            if os.path.exists(drive):
-                roots.append(drive)
-        return roots
-    return [os.path.abspath(os.sep)]
+        # One call returns a bitmask of drive letters, without probing each drive
+        bitmap = ctypes.windll.kernel32.GetLogicalDrives()
+        return [f"{chr(ord('A') + index)}:\\" for index in range(26) if bitmap & (1 << index)]
+    return list(_POSIX_ROOTS)
 
 
-def get_quick_access_path(path_type):
-    """Get common quick access paths (Desktop, Documents, Downloads, Project)"""
+# The POSIX root never changes; Windows drives come and go, so they are read per call
+_POSIX_ROOTS = (os.path.abspath(os.sep),)
+
+
+def build_quick_access_paths():
+    """Resolve the common quick access paths (Desktop, Documents, Downloads, Project) that exist"""
     user_home = os.path.expanduser("~")
     
     paths = {
@@ -99,24 +144,104 @@ def get_quick_access_path(path_type):
         paths["documents"] = os.path.join(desktop, "Documents")
         paths["downloads"] = os.path.join(desktop, "Downloads")
     
-    requested_path = paths.get(path_type.lower())
-    if requested_path and os.path.isdir(requested_path):
-        return requested_path
-    return None
+    return {name: path for name, path in paths.items() if os.path.isdir(path)}
 
 
-def load_chart_history():
-    if not os.path.exists(CHART_HISTORY_FILE):
-        return []
+# Resolved once at startup; these folders are fixed for the lifetime of the process
+_QUICK_PATHS = build_quick_access_paths()
+
+
+def get_quick_access_path(path_type):
+    return _QUICK_PATHS.get(path_type.lower())
+
+
+# Newest entries first; reloaded whenever the log's (mtime, size) differs from "key",
+# so every worker process serves what is on disk
+_HISTORY_CACHE = deque(maxlen=CHART_HISTORY_LIMIT)
+_history_state = {"loaded": False, "key": None, "lines": 0}
+
+
+def _history_file_key():
+    try:
+        stat = os.stat(CHART_HISTORY_FILE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_history_lines():
+    entries = []
+    with open(CHART_HISTORY_FILE, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue
+    return entries
+
+
+def _write_history_lines(entries):
+    # entries are oldest first, matching the append order of the log
+    tmp_path = CHART_HISTORY_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for entry in entries:
+            f.write(orjson.dumps(entry) + b"\n")
+    os.replace(tmp_path, CHART_HISTORY_FILE)
+
+
+def _ensure_history_loaded():
+    key = _history_file_key()
+    if _history_state["loaded"] and key is not None and key == _history_state["key"]:
+        return
+
+    entries = []
     try:
-        with open(CHART_HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        if key is not None:
+            entries = _read_history_lines()
+        elif os.path.exists(LEGACY_CHART_HISTORY_FILE):
+            # Migrate the old newest-first JSON array into the append-only log
+            legacy = read_json_file(LEGACY_CHART_HISTORY_FILE)
+            if isinstance(legacy, list):
+                entries = list(reversed(legacy[:CHART_HISTORY_LIMIT]))
+                _write_history_lines(entries)
+                key = _history_file_key()
     except Exception:
-        return []
+        entries = []
+
+    _HISTORY_CACHE.clear()
+    _HISTORY_CACHE.extendleft(entries[-CHART_HISTORY_LIMIT:])
+    _history_state["key"] = key
+    _history_state["lines"] = len(entries)
+    _history_state["loaded"] = True
+
+
+def _compact_chart_history():
+    # Rewrite from the rows on disk, which include entries other workers appended
+    try:
+        entries = _read_history_lines()
+        _write_history_lines(entries[-CHART_HISTORY_LIMIT:])
+    except Exception:
+        pass
+
+
+def load_chart_history():
+    _ensure_history_loaded()
+    return list(_HISTORY_CACHE)
+
+
+def load_chart_history_with_etag():
+    # The ETag is the log version the cache was built from, so it always matches the body served
+    _ensure_history_loaded()
+    key = _history_state["key"]
+    etag = f"{key[0]:x}-{key[1]:x}" if key is not None else None
+    return list(_HISTORY_CACHE), etag
 
 
 def save_chart_to_history(labels, values, revenue, product, time_mode, filename=""):
-    history = load_chart_history()
+    _ensure_history_loaded()
     entry = {
         "id": uuid.uuid4().hex[:8],
         "timestamp": datetime.now().isoformat(),
@@ -127,14 +252,26 @@ def save_chart_to_history(labels, values, revenue, product, time_mode, filename=
         "time_mode": time_mode,
         "filename": filename,
     }
-    history.insert(0, entry)
-    # Keep only last 20 chart sessions
-    history = history[:20]
+    line = orjson.dumps(entry) + b"\n"
+    previous_key = _history_state["key"]
     try:
-        with open(CHART_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
+        with open(CHART_HISTORY_FILE, "ab") as f:
+            f.write(line)
     except Exception:
-        pass
+        # The cache only ever reflects the log, so a failed append is not served
+        return entry["id"]
+
+    key = _history_file_key()
+    previous_size = previous_key[1] if previous_key is not None else 0
+    if key is not None and key[1] == previous_size + len(line):
+        # Nobody else appended in between; extend the cache instead of re-reading the log
+        # Deque keeps only the last 20 chart sessions
+        _HISTORY_CACHE.appendleft(entry)
+        _history_state["key"] = key
+        _history_state["lines"] += 1
+
+    if _history_state["lines"] > CHART_HISTORY_COMPACT_LINES:
+        _compact_chart_history()
     return entry["id"]
 
 
@@ -142,18 +279,152 @@ storage_config = load_storage_config()
 apply_storage_paths(storage_config["upload_folder"], storage_config["output_folder"])
 
 
-def read_csv_flexible(filepath):
+ENCODING_PROBE_BYTES = 64 * 1024
+# Detected encoding per uploaded file, shared by the two POSTs of the upload flow;
+# bounded so it does not grow by one entry per upload forever
+ENCODING_CACHE_LIMIT = 256
+_ENCODING_CACHE = {}
+_ENCODING_CACHE_LOCK = threading.Lock()
+
+
+def _remember_encoding(filepath, encoding):
+    # Upload parsing runs on worker threads, so evictions must not interleave
+    with _ENCODING_CACHE_LOCK:
+        _ENCODING_CACHE.pop(filepath, None)
+        _ENCODING_CACHE[filepath] = encoding
+        while len(_ENCODING_CACHE) > ENCODING_CACHE_LIMIT:
+            # dicts keep insertion order, so the first key is the oldest upload
+            _ENCODING_CACHE.pop(next(iter(_ENCODING_CACHE)), None)
+
+
+def detect_csv_encoding(filepath):
+    cached = _ENCODING_CACHE.get(filepath)
+    if cached:
+        return cached
+
+    with open(filepath, "rb") as f:
+        head = f.read(ENCODING_PROBE_BYTES)
+    try:
+        head.decode("utf-8")
+        encoding = "utf-8"
+    except UnicodeDecodeError as exc:
+        # A multi-byte character cut off at the probe boundary is still valid UTF-8
+        truncated = exc.end == len(head) and exc.reason == "unexpected end of data"
+        encoding = "utf-8" if truncated else "latin1"
+
+    _remember_encoding(filepath, encoding)
+    return encoding
+
+
+def _read_with_detected_encoding(filepath, read):
+    encoding = detect_csv_encoding(filepath)
+    try:
+        return read(encoding)
+    except UnicodeDecodeError:
+        # Invalid bytes past the probed prefix; latin1 decodes anything
+        if encoding == "latin1":
+            raise
+        _remember_encoding(filepath, "latin1")
+        return read("latin1")
+
+
+def read_csv_flexible(filepath, **read_options):
+    return _read_with_detected_encoding(
+        filepath, lambda encoding: pd.read_csv(filepath, encoding=encoding, **read_options)
+    )
+
+
+# pandas dtype names used by callers, mapped to the Arrow types pyarrow parses into
+_ARROW_COLUMN_TYPES = {
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "float64": pa.float64(),
+    "string": pa.string(),
+}
+# pandas.read_csv's default NA markers, so both readers drop the same rows
+_PANDAS_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def read_csv_typed(filepath, usecols, dtypes):
+    """Parse only the selected columns with pyarrow's multithreaded reader, casting them while parsing.
+
+    Columns left out of dtypes are type-inferred by pyarrow, so callers should pin them to "string".
+    """
+
+    def read_table(encoding):
+        try:
+            table = pacsv.read_csv(
+                filepath,
+                read_options=pacsv.ReadOptions(use_threads=True, encoding=encoding),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=usecols,
+                    column_types={col: _ARROW_COLUMN_TYPES[dtype] for col, dtype in dtypes.items()},
+                    null_values=_PANDAS_NULL_VALUES,
+                    strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid as exc:
+            # Surface bad bytes past the probed prefix the same way pandas does
+            if "utf8" in str(exc).lower():
+                raise UnicodeDecodeError(encoding, b"", 0, 1, str(exc)) from exc
+            raise
+        # Dictionary columns come back as pandas categoricals
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    return _read_with_detected_encoding(filepath, read_table)
+
+
+def parquet_sidecar_path(filepath):
+    return filepath + ".parquet"
+
+
+def read_parquet_sidecar(filepath, columns):
+    parquet_path = parquet_sidecar_path(filepath)
+    if not os.path.exists(parquet_path):
+        return None
     try:
-        return pd.read_csv(filepath, encoding="utf-8")
+        return pd.read_parquet(parquet_path, columns=columns)
     except Exception:
-        return pd.read_csv(filepath, encoding="latin1")
+        return None
+
+
+_MONTH_LUT = {
+    **{name.lower(): number for number, name in enumerate(calendar.month_abbr) if name},
+    **{name.lower(): number for number, name in enumerate(calendar.month_name) if name},
+    **{str(number): number for number in range(1, 13)},
+    **{f"{number:02d}": number for number in range(1, 13)},
+}
 
 
 def parse_month_to_number(month_series):
-    numeric = pd.to_numeric(month_series, errors="coerce")
-    short_name = pd.to_datetime(month_series.astype(str), format="%b", errors="coerce").dt.month
-    full_name = pd.to_datetime(month_series.astype(str), format="%B", errors="coerce").dt.month
-    return numeric.fillna(short_name).fillna(full_name)
+    normalized = month_series.astype(str).str.strip().str.lower()
+    months = normalized.map(_MONTH_LUT).astype("float64")
+
+    # Only values the lookup missed (e.g. "3.0" or out-of-range numbers) need numeric parsing
+    missing = months.isna()
+    if missing.any():
+        months[missing] = pd.to_numeric(month_series[missing], errors="coerce")
+    return months
+
+
+def write_excel_report(df, excel_path):
+    """Write df row by row so xlsxwriter can flush each row to disk as it goes."""
+    # pandas' to_excel emits cells column by column, which constant_memory mode would drop
+    # Format dates as to_excel did; Excel has no timezones, so aware values drop their UTC offset.
+    # Infinite totals (e.g. "inf" or "1e400" in the CSV) become #NUM! cells instead of failing the export.
+    options = {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        "remove_timezone": True,
+        "nan_inf_to_errors": True,
+    }
+    with xlsxwriter.Workbook(excel_path, options) as workbook:
+        worksheet = workbook.add_worksheet("Sheet1")
+        worksheet.write_row(0, 0, [str(col) for col in df.columns])
+        for row_number, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_number, 0, [None if pd.isna(value) else value for value in row])
 
 
 def guess_column(columns, preferred_names):
@@ -163,41 +434,287 @@ def guess_column(columns, preferred_names):
     return ""
 
 
+def build_column_defaults(columns):
+    return {
+        "product_col": guess_column(columns, ["product", "item", "product_name"]),
+        "total_col": guess_column(columns, ["total", "amount", "revenue", "sales"]),
+        "quantity_col": guess_column(columns, ["quantity", "qty", "units"]),
+        "price_col": guess_column(columns, ["price", "unit_price", "rate"]),
+        "date_col": guess_column(columns, ["date", "order_date", "invoice_date"]),
+        "year_col": guess_column(columns, ["year"]),
+        "month_col": guess_column(columns, ["month"]),
+    }
+
+
+# Upload parsing runs here so the request thread only has to save the file
+EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+# file_token -> Future returning the normalized column names
+UPLOAD_JOBS = {}
+# file_token -> time.monotonic() when its job finished; finished jobs nobody collects expire
+UPLOAD_JOB_FINISHED_AT = {}
+UPLOAD_JOB_TTL_SECONDS = 15 * 60
+
+
+def submit_upload_job(file_token, filepath):
+    evict_stale_upload_jobs()
+    future = EXECUTOR.submit(parse_upload, filepath)
+    future.add_done_callback(lambda _: UPLOAD_JOB_FINISHED_AT.__setitem__(file_token, time.monotonic()))
+    UPLOAD_JOBS[file_token] = future
+
+
+def forget_upload_job(file_token):
+    UPLOAD_JOBS.pop(file_token, None)
+    UPLOAD_JOB_FINISHED_AT.pop(file_token, None)
+
+
+def evict_stale_upload_jobs():
+    cutoff = time.monotonic() - UPLOAD_JOB_TTL_SECONDS
+    for file_token, finished_at in list(UPLOAD_JOB_FINISHED_AT.items()):
+        if finished_at < cutoff:
+            forget_upload_job(file_token)
+
+
+def parse_upload(filepath):
+    df_preview = read_csv_flexible(filepath)
+
+    # Columnar copy lets the process step load only the mapped columns
+    try:
+        df_preview.to_parquet(parquet_sidecar_path(filepath), index=False)
+    except Exception:
+        pass
+
+    return df_preview.columns.str.strip().str.lower().tolist()
+
+
+def render_upload_columns(file_token):
+    future = UPLOAD_JOBS.get(file_token)
+    if future is not None and not future.done():
+        return render_template("index.html", pending_upload=file_token)
+
+    filepath = os.path.join(UPLOAD_FOLDER, file_token)
+    if future is not None:
+        forget_upload_job(file_token)
+        try:
+            columns = future.result()
+        except Exception:
+            return render_template("index.html", error="Unable to read CSV file.")
+    elif os.path.exists(filepath):
+        # Job already collected (e.g. page reload); the header alone gives the columns
+        try:
+            header = read_csv_flexible(filepath, nrows=0)
+        except Exception:
+            return render_template("index.html", error="Unable to read CSV file.")
+        columns = header.columns.str.strip().str.lower().tolist()
+    else:
+        return render_template("index.html", error="Uploaded file not found. Please upload again.")
+
+    return render_template(
+        "index.html",
+        columns=columns,
+        file_token=file_token,
+        defaults=build_column_defaults(columns),
+        selected_mode="date",
+    )
+
+
+# Keyed on the output folder and its mtime so repeat page views skip the scan
+_REPORTS_CACHE = {"key": None, "value": None}
+
+
+def atomic_link(src, dst):
+    """Point dst at src's contents, hard linking where the filesystem allows it."""
+    # Unique temp name so concurrent runs updating the same dst don't remove each other's link
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        _remove_if_exists(tmp_path)
+
+
+def excel_source_path(excel_path):
+    return excel_path + ".parquet"
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+LATEST_EXCEL_NAME = "sales_report.xlsx"
+# Names the timestamped report /download_excel serves as sales_report.xlsx
+LATEST_EXCEL_POINTER = "latest_excel.json"
+
+
+def load_latest_excel_name():
+    try:
+        name = read_json_file(os.path.join(OUTPUT_FOLDER, LATEST_EXCEL_POINTER)).get("excel")
+    except Exception:
+        return None
+    return os.path.basename(name) if name else None
+
+
+def save_latest_excel_name(excel_filename):
+    pointer_path = os.path.join(OUTPUT_FOLDER, LATEST_EXCEL_POINTER)
+    tmp_path = f"{pointer_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write_json_file(tmp_path, {"excel": excel_filename})
+        os.replace(tmp_path, pointer_path)
+    finally:
+        _remove_if_exists(tmp_path)
+
+
+def publish_excel_report(df, excel_path):
+    """Store df as Parquet and defer building the workbook until it is first downloaded."""
+    # Two runs in the same second share excel_path; a workbook built for the earlier one must not be served
+    _remove_if_exists(excel_path)
+    try:
+        df.to_parquet(excel_source_path(excel_path), index=False)
+    except Exception:
+        # Frames pyarrow cannot store are exported right away, as before
+        _remove_if_exists(excel_source_path(excel_path))
+        write_excel_report(df, excel_path)
+
+    # "Latest" is a pointer rather than a file of its own: every timestamped workbook is built
+    # at most once from its own source, so a slow download can never store an outdated copy
+    save_latest_excel_name(os.path.basename(excel_path))
+
+    # Files from before the pointer existed would otherwise shadow it in the reports list
+    latest_path = os.path.join(OUTPUT_FOLDER, LATEST_EXCEL_NAME)
+    _remove_if_exists(latest_path)
+    _remove_if_exists(excel_source_path(latest_path))
+    _remove_if_exists(report_kpis_path(latest_path))
+
+
+def ensure_excel_report(excel_path):
+    if os.path.isfile(excel_path):
+        return
+    source_path = excel_source_path(excel_path)
+    if not os.path.isfile(source_path):
+        return
+
+    # Unique temp name so concurrent first downloads don't write the same file
+    tmp_path = f"{excel_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            with open(source_path, "rb") as source:
+                source_stat = os.fstat(source.fileno())
+                df = pd.read_parquet(source)
+        except Exception:
+            # A concurrent first download may have built the workbook and removed the source
+            if os.path.isfile(excel_path):
+                return
+            raise
+        write_excel_report(df, tmp_path)
+        # Keep the processing time as the workbook's mtime; list_reports orders "latest" by it
+        os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_path, excel_path)
+    finally:
+        _remove_if_exists(tmp_path)
+    _remove_if_exists(source_path)
+
+
+def report_kpis_path(excel_path):
+    return excel_path + ".kpis.json"
+
+
+def save_report_kpis(excel_path, kpis):
+    try:
+        write_json_file(report_kpis_path(excel_path), kpis)
+    except Exception:
+        pass
+
+
+def load_report_kpis(excel_path):
+    kpis_path = report_kpis_path(excel_path)
+    if not os.path.exists(kpis_path):
+        return None
+    try:
+        return read_json_file(kpis_path)
+    except Exception:
+        return None
+
+
 def list_reports():
+    cache_key = (OUTPUT_FOLDER, os.stat(OUTPUT_FOLDER).st_mtime_ns)
+    if _REPORTS_CACHE["key"] == cache_key:
+        return list(_REPORTS_CACHE["value"])
+
     reports = []
-    for filename in os.listdir(OUTPUT_FOLDER):
-        if not filename.lower().endswith((".xlsx", ".pdf")):
-            continue
+    deferred = {}
+    with os.scandir(OUTPUT_FOLDER) as entries:
+        for entry in entries:
+            lowered = entry.name.lower()
+            if lowered.endswith(".xlsx.parquet") and entry.is_file():
+                # Workbook not built yet; list it under its .xlsx name
+                deferred[entry.name[: -len(".parquet")]] = entry.stat()
+                continue
+
+            if not lowered.endswith((".xlsx", ".pdf")):
+                continue
+
+            if not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            reports.append(
+                {
+                    "name": entry.name,
+                    "size_kb": round(stat.st_size / 1024, 2),
+                    "updated_at": datetime.fromtimestamp(stat.st_mtime),
+                    "type": "Excel" if lowered.endswith(".xlsx") else "PDF",
+                }
+            )
 
-        filepath = os.path.join(OUTPUT_FOLDER, filename)
-        if not os.path.isfile(filepath):
+    listed = {item["name"] for item in reports}
+    for name, stat in deferred.items():
+        if name in listed:
             continue
-
-        stat = os.stat(filepath)
         reports.append(
             {
-                "name": filename,
-                "size_kb": round(stat.st_size / 1024, 2),
+                "name": name,
+                # The workbook's size is unknown until it is built
+                "size_kb": None,
                 "updated_at": datetime.fromtimestamp(stat.st_mtime),
-                "type": "Excel" if filename.lower().endswith(".xlsx") else "PDF",
+                "type": "Excel",
             }
         )
 
     reports.sort(key=lambda item: item["updated_at"], reverse=True)
-    return reports
+    _REPORTS_CACHE["key"] = cache_key
+    _REPORTS_CACHE["value"] = reports
+    return list(reports)
+
+
+def _get_reports_for_request():
+    # Summary builders in the same request share one listing of the output folder
+    cached = g.get("reports")
+    if cached is None or cached[0] != OUTPUT_FOLDER:
+        cached = (OUTPUT_FOLDER, list_reports())
+        g.reports = cached
+    return cached[1]
 
 
 def build_analytics_summary():
-    reports = list_reports()
+    reports = _get_reports_for_request()
     excel_reports = [item for item in reports if item["type"] == "Excel"]
     pdf_reports = [item for item in reports if item["type"] == "PDF"]
 
-    total_size_kb = round(sum(item["size_kb"] for item in reports), 2)
+    total_size_kb = round(sum(item["size_kb"] for item in reports if item["size_kb"] is not None), 2)
     latest_report = reports[0] if reports else None
 
     latest_excel_kpis = None
     if excel_reports:
         latest_excel_path = os.path.join(OUTPUT_FOLDER, excel_reports[0]["name"])
+        latest_excel_kpis = load_report_kpis(latest_excel_path)
+
+    # Reports written before KPI sidecars existed still need the workbook parsed
+    if excel_reports and latest_excel_kpis is None:
         try:
             latest_df = pd.read_excel(latest_excel_path)
             latest_df.columns = latest_df.columns.str.strip().str.lower()
@@ -227,17 +744,33 @@ def build_analytics_summary():
     }
 
 
+# Same mtime keying as _REPORTS_CACHE, so /settings skips the scan while uploads are unchanged
+_UPLOADS_COUNT_CACHE = {"key": None, "value": 0}
+
+
+def count_upload_files():
+    cache_key = (UPLOAD_FOLDER, os.stat(UPLOAD_FOLDER).st_mtime_ns)
+    if _UPLOADS_COUNT_CACHE["key"] == cache_key:
+        return _UPLOADS_COUNT_CACHE["value"]
+
+    with os.scandir(UPLOAD_FOLDER) as entries:
+        # Parquet sidecars are caches of an upload, not uploads themselves
+        count = sum(
+            1 for entry in entries if entry.is_file(follow_symlinks=False) and not entry.name.endswith(".parquet")
+        )
+
+    _UPLOADS_COUNT_CACHE["key"] = cache_key
+    _UPLOADS_COUNT_CACHE["value"] = count
+    return count
+
+
 def build_settings_summary():
-    reports = list_reports()
+    reports = _get_reports_for_request()
     excel_count = len([item for item in reports if item["type"] == "Excel"])
     pdf_count = len([item for item in reports if item["type"] == "PDF"])
     latest_report = reports[0] if reports else None
 
-    upload_files_count = 0
-    for name in os.listdir(UPLOAD_FOLDER):
-        path = os.path.join(UPLOAD_FOLDER, name)
-        if os.path.isfile(path):
-            upload_files_count += 1
+    upload_files_count = count_upload_files()
 
     return {
         "app_name": "AutoSales Dashboard",
@@ -254,7 +787,7 @@ def build_settings_summary():
 
 
 def build_admin_summary():
-    reports = list_reports()
+    reports = _get_reports_for_request()
     latest_activity = reports[0]["updated_at"] if reports else None
     return {
         "name": "Admin User",
@@ -277,34 +810,12 @@ def index():
             if file is None or file.filename == "":
                 return render_template("index.html", error="Please upload a file first.")
 
-            file_token = f"{uuid.uuid4().hex}_{file.filename}"
+            file_token = f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
             filepath = os.path.join(UPLOAD_FOLDER, file_token)
             file.save(filepath)
 
-            try:
-                df_preview = read_csv_flexible(filepath)
-            except Exception:
-                return render_template("index.html", error="Unable to read CSV file.")
-
-            df_preview.columns = df_preview.columns.str.strip().str.lower()
-            columns = df_preview.columns.tolist()
-            defaults = {
-                "product_col": guess_column(columns, ["product", "item", "product_name"]),
-                "total_col": guess_column(columns, ["total", "amount", "revenue", "sales"]),
-                "quantity_col": guess_column(columns, ["quantity", "qty", "units"]),
-                "price_col": guess_column(columns, ["price", "unit_price", "rate"]),
-                "date_col": guess_column(columns, ["date", "order_date", "invoice_date"]),
-                "year_col": guess_column(columns, ["year"]),
-                "month_col": guess_column(columns, ["month"]),
-            }
-
-            return render_template(
-                "index.html",
-                columns=columns,
-                file_token=file_token,
-                defaults=defaults,
-                selected_mode="date",
-            )
+            submit_upload_job(file_token, filepath)
+            return render_template("index.html", pending_upload=file_token)
 
         if action == "process_data":
             file_token = request.form.get("file_token", "")
@@ -316,12 +827,12 @@ def index():
                 return render_template("index.html", error="Uploaded file not found. Please upload again.")
 
             try:
-                df = read_csv_flexible(filepath)
+                header = read_csv_flexible(filepath, nrows=0)
             except Exception:
                 return render_template("index.html", error="Unable to read uploaded CSV.")
 
-            df.columns = df.columns.str.strip().str.lower()
-            columns = df.columns.tolist()
+            source_columns = {col.strip().lower(): col for col in header.columns}
+            columns = list(source_columns)
 
             time_mode = request.form.get("time_mode", "date").strip().lower()
             if time_mode not in {"date", "year_month", "year", "month"}:
@@ -355,13 +866,8 @@ def index():
                     selected_mode=time_mode,
                 )
 
-            if total_col and total_col in columns:
-                df["total"] = pd.to_numeric(df[total_col], errors="coerce")
-            elif quantity_col in columns and price_col in columns:
-                df["total"] = pd.to_numeric(df[quantity_col], errors="coerce") * pd.to_numeric(
-                    df[price_col], errors="coerce"
-                )
-            else:
+            has_total = bool(total_col) and total_col in columns
+            if not has_total and (quantity_col not in columns or price_col not in columns):
                 return render_template(
                     "index.html",
                     error="Enter total column name, or both quantity and price column names.",
@@ -371,7 +877,40 @@ def index():
                     selected_mode=time_mode,
                 )
 
-            df["product"] = df[product_col]
+            # Only parse the columns the selected mapping actually uses
+            selected = [product_col, total_col, quantity_col, price_col, date_col, year_col, month_col]
+            usecols = list(dict.fromkeys(source_columns[col] for col in selected if col in source_columns))
+            # Time columns stay text, as pandas reads them; they are parsed per time mode below
+            text_dtypes = {col: "string" for col in usecols}
+            text_dtypes[source_columns[product_col]] = "category"
+            dtypes = dict(text_dtypes)
+            for col in (total_col, quantity_col, price_col):
+                if col in source_columns and col != product_col:
+                    dtypes[source_columns[col]] = "float64"
+
+            try:
+                df = read_parquet_sidecar(filepath, usecols)
+                if df is not None:
+                    df[source_columns[product_col]] = df[source_columns[product_col]].astype("category")
+                else:
+                    try:
+                        df = read_csv_typed(filepath, usecols, dtypes)
+                    except ValueError:
+                        # Numeric columns with stray text are coerced below instead
+                        df = read_csv_typed(filepath, usecols, text_dtypes)
+            except Exception:
+                return render_template("index.html", error="Unable to read uploaded CSV.")
+
+            df.columns = df.columns.str.strip().str.lower()
+
+            if has_total:
+                df["total"] = pd.to_numeric(df[total_col], errors="coerce")
+            else:
+                df["total"] = pd.to_numeric(df[quantity_col], errors="coerce") * pd.to_numeric(
+                    df[price_col], errors="coerce"
+                )
+
+            df["product"] = df[product_col].astype("category")
 
             if quantity_col in columns:
                 df["quantity"] = pd.to_numeric(df[quantity_col], errors="coerce")
@@ -387,7 +926,8 @@ def index():
                     selected_mode=time_mode,
                 )
 
-            chart_df = df.copy()
+            # Only the totals plus the derived time column are needed for grouping
+            chart_df = pd.DataFrame({"total": df["total"]}, index=df.index)
 
             if time_mode == "date":
                 if date_col not in columns:
@@ -399,7 +939,7 @@ def index():
                         defaults=defaults,
                         selected_mode=time_mode,
                     )
-                chart_df["date"] = pd.to_datetime(chart_df[date_col], errors="coerce")
+                chart_df["date"] = pd.to_datetime(df[date_col], errors="coerce")
                 chart_df.dropna(subset=["date"], inplace=True)
                 grouped = chart_df.groupby(chart_df["date"].dt.to_period("M"))["total"].sum().sort_index()
                 labels = grouped.index.astype(str).tolist()
@@ -415,8 +955,8 @@ def index():
                         defaults=defaults,
                         selected_mode=time_mode,
                     )
-                chart_df["year_num"] = pd.to_numeric(chart_df[year_col], errors="coerce")
-                chart_df["month_num"] = parse_month_to_number(chart_df[month_col])
+                chart_df["year_num"] = pd.to_numeric(df[year_col], errors="coerce")
+                chart_df["month_num"] = parse_month_to_number(df[month_col])
                 chart_df.dropna(subset=["year_num", "month_num"], inplace=True)
                 chart_df = chart_df[(chart_df["month_num"] >= 1) & (chart_df["month_num"] <= 12)]
                 chart_df["period"] = pd.PeriodIndex(
@@ -438,7 +978,7 @@ def index():
                         defaults=defaults,
                         selected_mode=time_mode,
                     )
-                chart_df["year_num"] = pd.to_numeric(chart_df[year_col], errors="coerce")
+                chart_df["year_num"] = pd.to_numeric(df[year_col], errors="coerce")
                 chart_df.dropna(subset=["year_num"], inplace=True)
                 grouped = chart_df.groupby(chart_df["year_num"].astype(int))["total"].sum().sort_index()
                 labels = [str(int(year)) for year in grouped.index.tolist()]
@@ -454,7 +994,7 @@ def index():
                         defaults=defaults,
                         selected_mode=time_mode,
                     )
-                chart_df["month_num"] = parse_month_to_number(chart_df[month_col])
+                chart_df["month_num"] = parse_month_to_number(df[month_col])
                 chart_df.dropna(subset=["month_num"], inplace=True)
                 chart_df = chart_df[(chart_df["month_num"] >= 1) & (chart_df["month_num"] <= 12)]
                 grouped = chart_df.groupby(chart_df["month_num"].astype(int))["total"].sum().sort_index()
@@ -471,19 +1011,24 @@ def index():
                     selected_mode=time_mode,
                 )
 
-            total_revenue = df["total"].sum()
+            # One grouped pass yields revenue, best seller and the top product by revenue
+            product_aggs = {"total": ("total", "sum")}
+            rank_by = "total"
             if "quantity" in df.columns and df["quantity"].notna().any():
-                best_product = df.groupby("product")["quantity"].sum().idxmax()
-            else:
-                best_product = df.groupby("product")["total"].sum().idxmax()
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                product_aggs["quantity"] = ("quantity", "sum")
+                rank_by = "quantity"
+            product_summary = df.groupby("product", sort=False, observed=True).agg(**product_aggs)
+            total_revenue = float(product_summary["total"].sum())
+            best_product = product_summary[rank_by].idxmax()
+
+            # The suffix keeps runs within the same second from rewriting each other's files in place
+            timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
             excel_filename = f"sales_report_{timestamp}.xlsx"
             pdf_filename = f"summary_{timestamp}.pdf"
             excel_path = os.path.join(OUTPUT_FOLDER, excel_filename)
             pdf_path = os.path.join(OUTPUT_FOLDER, pdf_filename)
 
-            df.to_excel(excel_path, index=False)
+            publish_excel_report(df, excel_path)
 
             doc = SimpleDocTemplate(pdf_path)
             styles = getSampleStyleSheet()
@@ -492,8 +1037,15 @@ def index():
             elements.append(Paragraph(f"Best Product: {best_product}", styles["Normal"]))
             doc.build(elements)
 
-            shutil.copyfile(excel_path, os.path.join(OUTPUT_FOLDER, "sales_report.xlsx"))
-            shutil.copyfile(pdf_path, os.path.join(OUTPUT_FOLDER, "summary.pdf"))
+            atomic_link(pdf_path, os.path.join(OUTPUT_FOLDER, "summary.pdf"))
+
+            # Same figures the analytics page used to derive by re-reading the workbook
+            report_kpis = {
+                "rows": int(df.shape[0]),
+                "total_revenue": float(total_revenue),
+                "top_product": str(product_summary["total"].idxmax()),
+            }
+            save_report_kpis(excel_path, report_kpis)
 
             # Save chart data to history for later review
             save_chart_to_history(labels, values, total_revenue, best_product, time_mode, excel_filename)
@@ -511,6 +1063,10 @@ def index():
                 selected_mode=time_mode,
             )
 
+    upload_token = request.args.get("file_token", "").strip()
+    if upload_token:
+        return render_upload_columns(os.path.basename(upload_token))
+
     # Handle loading chart from history
     loaded_chart_id = request.args.get("loaded_chart", "").strip()
     if loaded_chart_id:
@@ -533,7 +1089,7 @@ def index():
 
 @app.route("/reports")
 def reports_page():
-    reports = list_reports()
+    reports = _get_reports_for_request()
     return render_template("reports.html", reports=reports)
 
 
@@ -578,27 +1134,24 @@ def api_list_dirs():
     path = request.args.get("path", "").strip()
 
     if not path:
-        return jsonify({"current": "", "parent": None, "directories": get_directory_roots()})
+        return json_response({"current": "", "parent": None, "directories": get_directory_roots()})
 
     normalized = os.path.abspath(path)
     if not os.path.isdir(normalized):
-        return jsonify({"error": "Directory not found."}), 404
+        return json_response({"error": "Directory not found."}, status=404)
 
     parent = os.path.dirname(normalized)
     if parent == normalized:
         parent = None
 
-    directories = []
     try:
-        for name in os.listdir(normalized):
-            full_path = os.path.join(normalized, name)
-            if os.path.isdir(full_path):
-                directories.append(full_path)
+        with os.scandir(normalized) as entries:
+            directories = [entry.path for entry in entries if entry.is_dir()]
     except PermissionError:
-        return jsonify({"error": "Permission denied for this directory."}), 403
+        return json_response({"error": "Permission denied for this directory."}, status=403)
 
-    directories.sort(key=lambda item: item.lower())
-    return jsonify({"current": normalized, "parent": parent, "directories": directories})
+    directories.sort(key=str.lower)
+    return json_response({"current": normalized, "parent": parent, "directories": directories})
 
 
 @app.route("/api/quick_path")
@@ -613,9 +1166,34 @@ def api_quick_path():
     return jsonify({"error": f"Path '{path_type}' not available."}), 404
 
 
+@app.route("/api/upload_status/<path:file_token>")
+def api_upload_status(file_token):
+    file_token = os.path.basename(file_token)
+    evict_stale_upload_jobs()
+    future = UPLOAD_JOBS.get(file_token)
+    if future is None:
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, file_token)):
+            return jsonify({"status": "done"})
+        return jsonify({"error": "Upload not found."}), 404
+
+    if not future.done():
+        return jsonify({"status": "pending"})
+    if future.exception() is not None:
+        # Kept until the page renders the error or the job expires
+        return jsonify({"status": "error", "error": "Unable to read CSV file."})
+
+    # The column picker can rebuild the columns from the CSV header, so the job is done with
+    forget_upload_job(file_token)
+    return jsonify({"status": "done", "columns": future.result()})
+
+
 @app.route("/api/chart_history")
 def api_chart_history():
-    history = load_chart_history()
+    history, etag = load_chart_history_with_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
     # Return summary list without full data
     summary = []
     for entry in history:
@@ -627,37 +1205,66 @@ def api_chart_history():
             "time_mode": entry.get("time_mode"),
             "filename": entry.get("filename", ""),
         })
-    return jsonify(summary)
+    return with_history_etag(json_response(summary), etag)
 
 
 @app.route("/api/chart_history/<chart_id>")
 def api_chart_history_detail(chart_id):
-    history = load_chart_history()
+    history, etag = load_chart_history_with_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
     for entry in history:
         if entry.get("id") == chart_id:
-            return jsonify(entry)
-    return jsonify({"error": "Chart not found"}), 404
+            return with_history_etag(json_response(entry), etag)
+    return json_response({"error": "Chart not found"}, status=404)
 
 
-@app.route("/download_report/<path:filename>")
-def download_report(filename):
+def send_output_file(filename, download_name=None):
     safe_name = os.path.basename(filename)
+    download_name = download_name or safe_name
     file_path = os.path.join(OUTPUT_FOLDER, safe_name)
 
-    if not os.path.exists(file_path):
+    if safe_name.lower().endswith(".xlsx"):
+        ensure_excel_report(file_path)
+
+    if not os.path.isfile(file_path):
         abort(404)
 
-    return send_from_directory(OUTPUT_FOLDER, safe_name, as_attachment=True)
+    if X_ACCEL_REDIRECT_PREFIX:
+        # Nginx serves the bytes itself; the worker only sends headers
+        mimetype = mimetypes.guess_type(safe_name)[0] or "application/octet-stream"
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(safe_name)}"
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    else:
+        # conditional=True (the default) answers If-None-Match/If-Modified-Since with 304
+        response = send_from_directory(
+            OUTPUT_FOLDER, safe_name, as_attachment=True, download_name=download_name, conditional=True
+        )
+
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return response
+
+
+@app.route("/download_report/<path:filename>")
+def download_report(filename):
+    return send_output_file(filename)
 
 
 @app.route("/download_excel")
 def download_excel():
-    return send_file(os.path.join(OUTPUT_FOLDER, "sales_report.xlsx"), as_attachment=True)
+    latest_name = load_latest_excel_name()
+    if latest_name:
+        return send_output_file(latest_name, download_name=LATEST_EXCEL_NAME)
+    # Output folders from before the latest-report pointer still hold a real sales_report.xlsx
+    return send_output_file(LATEST_EXCEL_NAME)
 
 
 @app.route("/download_pdf")
 def download_pdf():
-    return send_file(os.path.join(OUTPUT_FOLDER, "summary.pdf"), as_attachment=True)
+    return send_output_file("summary.pdf")
 
 
 if __name__ == "__main__":